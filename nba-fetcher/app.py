@@ -1,24 +1,31 @@
 
 import asyncio
+import bisect
+import unicodedata
 from fastapi import FastAPI, HTTPException, Query
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from nba_api.stats.static import players
 from nba_api.stats.endpoints import playercareerstats, playergamelog, commonplayerinfo
-from pydantic import BaseModel
-from typing import List, Optional
+from nba_api.stats.library.http import NBAStatsHTTP
+from pydantic import BaseModel, ConfigDict
+from typing import List
 import logging
-from logging.handlers import RotatingFileHandler
 import concurrent.futures
+import requests
+from requests.adapters import HTTPAdapter
 import py_eureka_client.eureka_client as eureka_client
 
+import nba_cache
+
 import os
+import sys
 eureka_url = os.getenv('EUREKA_CLIENT_SERVICEURL_DEFAULTZONE')
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("nba-fetcher")
 
-import sys
-
 # Audit logger - Configuration for Docker/AWS (Stdout)
 
 
@@ -33,55 +40,162 @@ if not audit_logger.handlers:
     audit_handler.setFormatter(audit_formatter)
     audit_logger.addHandler(audit_handler)
 
-app = FastAPI(title="NBA Fetcher Microservice")
+app = FastAPI(
+    title="NBA Fetcher Microservice",
+    default_response_class=ORJSONResponse  # orjson encodes the list payloads much faster than stdlib json
+)
+
+# Compress list payloads (/players/batch, /players/search, /games) - repeated keys shrink well.
+# Small responses like /health stay under the threshold and go out uncompressed.
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
+# Reuse one pooled session for every nba_api call so TCP/TLS connections to
+# stats.nba.com stay alive between requests instead of reconnecting each time
+nba_session = requests.Session()
+nba_session.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=3))
+NBAStatsHTTP.set_session(nba_session)
+
+# Max threads for blocking nba_api calls (network I/O to stats.nba.com)
+NBA_API_THREADS = int(os.getenv("NBA_API_THREADS", 32))
+
+# Shared pool for per-player fan-out (batch + search) - created once instead of
+# spawning and tearing down threads on every request
+EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=16, thread_name_prefix="nba-fetch")
+
+# --- Player Name Index ---
+# nba_api's find_players_by_full_name runs a regex over every player on each call.
+# The player list is static, so index it once at import instead.
+def normalize_name(name: str) -> str:
+    """Lowercase and strip accents so 'Nikola Jokić' matches 'nikola jokic'"""
+    decomposed = unicodedata.normalize('NFD', name)
+    return ''.join(c for c in decomposed if unicodedata.category(c) != 'Mn').lower().strip()
+
+ALL_PLAYERS = players.get_players()
+
+# Exact normalized full name -> player (first entry wins, same as matches[0])
+PLAYERS_BY_NAME = {}
+for _player in ALL_PLAYERS:
+    PLAYERS_BY_NAME.setdefault(normalize_name(_player['full_name']), _player)
+
+# Sorted (name fragment, player) pairs with one fragment per word start, so a
+# prefix search for either "lebron" or "james" lands on "LeBron James"
+NAME_PREFIX_INDEX = sorted(
+    (
+        (' '.join(words[i:]), _player)
+        for _player in ALL_PLAYERS
+        for words in [normalize_name(_player['full_name']).split()]
+        for i in range(len(words))
+    ),
+    key=lambda entry: entry[0]
+)
+NAME_PREFIX_KEYS = [fragment for fragment, _ in NAME_PREFIX_INDEX]
 
 # --- Helper Functions ---
+def find_player(full_name: str):
+    """Exact (case/accent-insensitive) dict lookup, falling back to nba_api's regex search"""
+    player = PLAYERS_BY_NAME.get(normalize_name(full_name))
+    if player is None:
+        matches = players.find_players_by_full_name(full_name)
+        player = matches[0] if matches else None
+    return player
+
+def search_players_by_prefix(query: str, limit: int, active_only: bool = True):
+    """Players with a name word starting with query - bisect into the prefix index"""
+    prefix = normalize_name(query)
+    results = []
+    seen = set()
+    for i in range(bisect.bisect_left(NAME_PREFIX_KEYS, prefix), len(NAME_PREFIX_KEYS)):
+        fragment, player = NAME_PREFIX_INDEX[i]
+        if not fragment.startswith(prefix):
+            break
+        if player['id'] in seen or (active_only and not player['is_active']):
+            continue
+        seen.add(player['id'])
+        results.append(player)
+        if len(results) == limit:
+            break
+    return results
+
 def get_player_id_by_name(full_name: str):
-    matches = players.find_players_by_full_name(full_name)
-    if not matches:
+    player = find_player(full_name)
+    if not player:
         return None
-    return matches[0]['id']
+    return player['id']
+
+def player_info_key(player_id: int) -> str:
+    return f"nba:info:{player_id}"
+
+def result_set_row(endpoint, row: int):
+    """
+    One row of an endpoint's first result set as a dict.
+    Reads the JSON nba_api has already parsed instead of building a pandas DataFrame.
+    """
+    result_set = endpoint.data_sets[0].get_dict()
+    rows = result_set['data']
+    if not rows:
+        return None
+    return dict(zip(result_set['headers'], rows[row]))
+
+def load_player_info(player_id: int):
+    """CommonPlayerInfo row for a player as a dict, straight from the NBA API"""
+    return result_set_row(commonplayerinfo.CommonPlayerInfo(player_id=player_id), 0)
+
+def get_player_info(player_id: int):
+    """CommonPlayerInfo row for a player as a dict (cached in Redis)"""
+    return nba_cache.get_or_fetch(player_info_key(player_id), lambda: load_player_info(player_id))
+
+def get_latest_season_totals(player_id: int):
+    """Most recent season row of PlayerCareerStats as a dict (cached in Redis)"""
+    return nba_cache.get_or_fetch(
+        f"nba:career:{player_id}",
+        lambda: result_set_row(playercareerstats.PlayerCareerStats(player_id=player_id), -1)
+    )
+
+def build_player_summary(data: dict, info):
+    """Combine a static player entry with its CommonPlayerInfo row (may be None)"""
+    team_name = "Free Agent"
+    position = "N/A"
+    try:
+        if info:
+            if 'POSITION' in info:
+                position = str(info['POSITION'])
+            city = str(info['TEAM_CITY'])
+            nickname = str(info['TEAM_NAME'])
+            # Combine city + name (e.g., "Los Angeles Lakers")
+            # Check if 'city' is empty or null to avoid "nan Lakers"
+            if city and city.lower() != 'nan':
+                team_name = f"{city} {nickname}"
+            else:
+                team_name = nickname
+    except Exception:
+        logger.warning(f"Could not read team for {data['full_name']}")
+
+    return {
+        "id": data['id'],
+        "fullName": data['full_name'],
+        "teamName": team_name,
+        "position": position
+    }
 
 def fetch_player_data_with_team(name: str):
     """
     Helper to fetch both ID and Team Name for a single player.
-    Used by the batch endpoint in parallel.
+    Used by the search endpoint in parallel.
     """
     try:
-        matches = players.find_players_by_full_name(name)
-        if not matches:
+        data = find_player(name)
+        if not data:
             return None
 
-        data = matches[0]
-        player_id = data['id']
-
         # Fetch Team Info
         # This is the slow part, so we run it in parallel threads
-        team_name = "Free Agent"
-        position = "N/A"
+        info = None
         try:
-            info = commonplayerinfo.CommonPlayerInfo(player_id=player_id)
-            df = info.get_data_frames()[0]
-            if not df.empty:
-                if 'POSITION' in df.columns:
-                    position = str(df.iloc[0]['POSITION'])
-                city = str(df.iloc[0]['TEAM_CITY'])
-                nickname = str(df.iloc[0]['TEAM_NAME'])
-                # Combine city + name (e.g., "Los Angeles Lakers")
-                # Check if 'city' is empty or null to avoid "nan Lakers"
-                if city and city.lower() != 'nan':
-                    team_name = f"{city} {nickname}"
-                else:
-                    team_name = nickname
+            info = get_player_info(data['id'])
         except Exception:
             logger.warning(f"Could not fetch team for {name}")
 
-        return {
-            "id": player_id,
-            "fullName": data['full_name'],
-            "teamName": team_name,
-            "position": position
-        }
+        return build_player_summary(data, info)
     except Exception as e:
         logger.error(f"Error processing {name}: {e}")
         return None
@@ -90,8 +204,10 @@ async def register_with_eureka():
     """
     Attempts to register with Eureka in a loop until successful.
     This runs in the background so it doesn't crash the app on startup.
+    Retries back off exponentially (2s -> 60s) so a down Eureka isn't hammered.
     """
-    while True:
+    delay = 2
+    while not getattr(app.state, "eureka_registered", False):
         try:
             logger.info("Attempting to register with Eureka...")
             await eureka_client.init_async(
@@ -99,16 +215,25 @@ async def register_with_eureka():
                 app_name="NBA-FETCHER",
                 instance_port=5001
             )
+            app.state.eureka_registered = True
             logger.info("✅ Successfully registered with Eureka!")
-            break  # Exit loop on success
         except Exception as e:
-            logger.warning(f"❌ Eureka not ready yet ({e}). Retrying in 5 seconds...")
-            await asyncio.sleep(5)
+            logger.warning(f"❌ Eureka not ready yet ({e}). Retrying in {delay} seconds...")
+            await asyncio.sleep(delay)
+            delay = min(60, delay * 2)
 
 @app.on_event("startup")
 async def startup_event():
-    # Schedule the registration to run in the background
-    asyncio.create_task(register_with_eureka())
+    # Size the default executor explicitly - every blocking nba_api call is
+    # offloaded to it via asyncio.to_thread so the event loop stays free
+    asyncio.get_running_loop().set_default_executor(
+        concurrent.futures.ThreadPoolExecutor(max_workers=NBA_API_THREADS)
+    )
+    # Schedule the registration to run in the background (once per process)
+    if not eureka_url:
+        logger.warning("EUREKA_CLIENT_SERVICEURL_DEFAULTZONE not set - skipping Eureka registration")
+    elif getattr(app.state, "eureka_task", None) is None:
+        app.state.eureka_task = asyncio.create_task(register_with_eureka())
 
 @app.get("/health")
 def health_check():
@@ -122,12 +247,11 @@ def get_player(full_name: str):
         audit_logger.info(f"request|service=nba-fetcher|path=/player|player={full_name}")
     except Exception:
         pass
-    matches = players.find_players_by_full_name(full_name)
-    if not matches:
+    data = find_player(full_name)
+    if not data:
         audit_logger.info(f"not_found|service=nba-fetcher|player={full_name}")
         raise HTTPException(status_code=404, detail="Player not found")
 
-    data = matches[0]
     return {
         "id": data['id'],
         "fullName": data['full_name'],
@@ -137,80 +261,94 @@ def get_player(full_name: str):
     }
 
 @app.get("/players/search")
-def search_players_with_teams(query: str):
+async def search_players_with_teams(query: str):
     logger.info(f"Searching for partial matches: {query}")
     try:
         audit_logger.info(f"request|service=nba-fetcher|path=/players/search|q={query}")
     except Exception:
         pass
-    # 1. Find all matching players (regex based)
-    matches = players.find_players_by_full_name(query)
-    matches = [p for p in matches if p['is_active']]
-
-    # 2. Limit to top 5 matches to keep it fast
-    top_matches = matches[:5]
+    # 1. Find active players whose name starts with the query (top 5 to keep it fast),
+    # falling back to the regex search for mid-word matches
+    top_matches = search_players_by_prefix(query, limit=5)
+    if not top_matches:
+        matches = players.find_players_by_full_name(query)
+        top_matches = [p for p in matches if p['is_active']][:5]
 
-    results = []
     # 3. Fetch team data for all 5 in parallel (reusing your existing helper)
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        future_to_name = {
-            executor.submit(fetch_player_data_with_team, p['full_name']): p['full_name']
-            for p in top_matches
-        }
-
-        for future in concurrent.futures.as_completed(future_to_name):
-            data = future.result()
-            if data:
-                results.append(data)
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(*(
+        loop.run_in_executor(EXECUTOR, fetch_player_data_with_team, p['full_name'])
+        for p in top_matches
+    ))
 
-    return results
+    return [data for data in results if data]
 
 # 2. Batch Endpoint (UPDATED with Parallel Execution)
 class BatchRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
     names: List[str]
 
+def try_load_player_info(player):
+    """load_player_info that logs and returns None, so one failure doesn't abort EXECUTOR.map"""
+    try:
+        return load_player_info(player['id'])
+    except Exception:
+        logger.warning(f"Could not fetch team for {player['full_name']}")
+        return None
+
 @app.post("/players/batch")
 def get_players_batch(request: BatchRequest):
     try:
         audit_logger.info(f"request|service=nba-fetcher|path=/players/batch|count={len(request.names)}")
     except Exception:
         pass
-    results = []
-    # Use ThreadPoolExecutor to run API calls in parallel
-    # This makes fetching 10 players take ~1 second instead of ~10 seconds
-    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-        # Submit all tasks
-        future_to_name = {
-            executor.submit(fetch_player_data_with_team, name): name
-            for name in request.names
-        }
+    # 1. Resolve names locally (static player list, no network)
+    found = []
+    for name in request.names:
+        try:
+            player = find_player(name)
+        except Exception as e:
+            logger.error(f"Error processing {name}: {e}")
+            continue
+        if player:
+            found.append(player)
 
-        # Collect results as they finish
-        for future in concurrent.futures.as_completed(future_to_name):
-            data = future.result()
-            if data:
-                results.append(data)
+    # 2. One MGET round-trip for every player's cached team info
+    cached = nba_cache.get_many([player_info_key(p['id']) for p in found])
 
-    return results
+    # 3. Fetch only the misses from the NBA API, in parallel on the shared executor
+    misses = [p for p, info in zip(found, cached) if info is None]
+    fetched = dict(zip(
+        (p['id'] for p in misses),
+        EXECUTOR.map(try_load_player_info, misses)  # Results come back in input order
+    ))
+
+    # 4. One pipelined write for everything we just fetched
+    nba_cache.set_many({player_info_key(pid): info for pid, info in fetched.items() if info})
+
+    return [
+        build_player_summary(p, info if info is not None else fetched.get(p['id']))
+        for p, info in zip(found, cached)
+    ]
 
 # 3. Get Player Team
 @app.get("/player/{full_name}/team")
-def get_player_team(full_name: str):
+async def get_player_team(full_name: str):
     player_id = get_player_id_by_name(full_name)
     if not player_id:
         raise HTTPException(status_code=404, detail="Player not found")
 
     try:
-        info = commonplayerinfo.CommonPlayerInfo(player_id=player_id)
-        df = info.get_data_frames()[0]
-        if df.empty:
+        info = await asyncio.to_thread(get_player_info, player_id)
+        if not info:
             raise HTTPException(status_code=404, detail="No team info found")
 
         return {
-            "teamId": int(df.iloc[0]['TEAM_ID']),
-            "teamName": str(df.iloc[0]['TEAM_NAME']),
-            "teamCity": str(df.iloc[0]['TEAM_CITY']),
-            "teamAbbreviation": str(df.iloc[0]['TEAM_ABBREVIATION'])
+            "teamId": int(info['TEAM_ID']),
+            "teamName": str(info['TEAM_NAME']),
+            "teamCity": str(info['TEAM_CITY']),
+            "teamAbbreviation": str(info['TEAM_ABBREVIATION'])
         }
     except Exception as e:
         logger.error(f"Error fetching team: {e}")
@@ -219,19 +357,17 @@ def get_player_team(full_name: str):
 
 # 4. Get Season Averages
 @app.get("/player/{full_name}/stats")
-def get_player_season_averages(full_name: str):
+async def get_player_season_averages(full_name: str):
     player_id = get_player_id_by_name(full_name)
     if not player_id:
         raise HTTPException(status_code=404, detail="Player not found")
 
     try:
-        career = playercareerstats.PlayerCareerStats(player_id=player_id)
-        df = career.get_data_frames()[0]
+        latest = await asyncio.to_thread(get_latest_season_totals, player_id)
 
-        if df.empty:
+        if not latest:
             raise HTTPException(status_code=404, detail="No stats found")
 
-        latest = df.iloc[-1]
         games = int(latest['GP'])
 
         if games == 0:
@@ -263,41 +399,50 @@ def get_player_season_averages(full_name: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 # 5. Get Last N Games
+# PlayerGameLog column -> (response key, dtype) - cast and renamed once per request
+GAME_LOG_FIELDS = {
+    'Game_ID': ('gameId', 'str'),
+    'GAME_DATE': ('gameDate', 'str'),
+    'MATCHUP': ('matchup', 'str'),
+    'WL': ('wl', 'str'),
+    'PTS': ('points', 'int64'),
+    'AST': ('assists', 'int64'),
+    'REB': ('rebounds', 'int64'),
+    'STL': ('steals', 'int64'),
+    'BLK': ('blocks', 'int64'),
+    'TOV': ('turnovers', 'int64'),
+    'FG_PCT': ('fgPct', 'float64'),
+}
+GAME_LOG_CAST = {col: dtype for col, (_, dtype) in GAME_LOG_FIELDS.items()}
+GAME_LOG_RENAME = {col: key for col, (key, _) in GAME_LOG_FIELDS.items()}
+
 @app.get("/player/{full_name}/games")
-def get_player_game_log(full_name: str, limit: int = Query(5, ge=1, le=82)):
+async def get_player_game_log(full_name: str, limit: int = Query(5, ge=1, le=82)):
     player_id = get_player_id_by_name(full_name)
     if not player_id:
         raise HTTPException(status_code=404, detail="Player not found")
 
     try:
-        gamelog = playergamelog.PlayerGameLog(player_id=player_id)
-        df = gamelog.get_data_frames()[0]
+        df = await asyncio.to_thread(
+            lambda: playergamelog.PlayerGameLog(player_id=player_id).get_data_frames()[0]
+        )
 
         if df.empty:
             return []
 
         last_n = df.head(limit)
-        games = []
-        for index, row in last_n.iterrows():
-            games.append({
-                "gameId": str(row['Game_ID']),
-                "gameDate": str(row['GAME_DATE']),
-                "matchup": str(row['MATCHUP']),
-                "wl": str(row['WL']),
-                "points": int(row['PTS']),
-                "assists": int(row['AST']),
-                "rebounds": int(row['REB']),
-                "steals": int(row['STL']),
-                "blocks": int(row['BLK']),
-                "turnovers": int(row['TOV']),
-                "fgPct": float(row['FG_PCT'])
-            })
-
-        return games
+        # One vectorized astype + rename, then to_dict builds the rows in C - no per-cell casts
+        return (
+            last_n[list(GAME_LOG_FIELDS)]
+            .astype(GAME_LOG_CAST)
+            .rename(columns=GAME_LOG_RENAME)
+            .to_dict(orient="records")
+        )
     except Exception as e:
         logger.error(f"Error fetching game log: {e}")
         audit_logger.error(f"error|service=nba-fetcher|path=/player/{{full_name}}/games|error={e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 if __name__ == '__main__':
-    import uvicorn
\ No newline at end of file
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=5001)
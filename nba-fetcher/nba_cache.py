@@ -0,0 +1,77 @@
+"""
+Redis caching layer for NBA API lookups
+Player info and career stats rarely change within the hour, so cache them
+to avoid repeated round-trips to stats.nba.com.
+"""
+import redis
+import json
+import logging
+from typing import Any, Callable, Dict, List, Optional
+import os
+
+logger = logging.getLogger("nba-fetcher")
+
+# Redis connection settings
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")  # Redis server hostname
+REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))  # Redis port number
+REDIS_SSL = os.getenv("REDIS_SSL", "false").lower() == "true"  # Whether to use SSL
+CACHE_TTL = int(os.getenv("NBA_INFO_CACHE_TTL_SECONDS", 3600))  # Cache expiration time in seconds (1 hour)
+
+# Shared connection pool - safe to use from the fetcher's worker threads
+pool = redis.ConnectionPool(
+    host=REDIS_HOST,
+    port=REDIS_PORT,
+    db=2,  # Using database 2 for NBA API data (0 = stats service, 1 = predictions)
+    connection_class=redis.SSLConnection if REDIS_SSL else redis.Connection,
+    socket_connect_timeout=2,  # Fail fast so a Redis outage falls through to the NBA API
+    socket_timeout=2,
+    decode_responses=True  # Automatically decode responses to strings
+)
+redis_client = redis.Redis(connection_pool=pool)
+
+
+def get_or_fetch(key: str, loader: Callable[[], Optional[Any]], ttl: int = CACHE_TTL) -> Optional[Any]:
+    """
+    Return the cached value for key, or call loader() and cache its result.
+    Redis errors never fail the request - the loader is called instead.
+    """
+    try:
+        cached = redis_client.get(key)  # Redis returns None if key doesn't exist or expired
+        if cached is not None:
+            return json.loads(cached)  # Convert JSON string back to dict
+    except Exception as e:
+        logger.warning(f"Error reading {key} from cache: {e}")
+
+    value = loader()
+    if value is None:
+        return None  # Nothing to cache (e.g. empty NBA API response)
+
+    try:
+        redis_client.setex(key, ttl, json.dumps(value))  # Convert dict to JSON string for storage
+    except Exception as e:
+        logger.warning(f"Error writing {key} to cache: {e}")
+    return value
+
+
+def get_many(keys: List[str]) -> List[Optional[Any]]:
+    """Fetch several keys in one MGET round-trip - None for each miss"""
+    if not keys:
+        return []
+    try:
+        return [json.loads(v) if v is not None else None for v in redis_client.mget(keys)]
+    except Exception as e:
+        logger.warning(f"Error reading {len(keys)} keys from cache: {e}")
+        return [None] * len(keys)
+
+
+def set_many(items: Dict[str, Any], ttl: int = CACHE_TTL) -> None:
+    """Write several keys with the same TTL in one pipelined round-trip"""
+    if not items:
+        return
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for key, value in items.items():
+            pipe.setex(key, ttl, json.dumps(value))
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Error writing {len(items)} keys to cache: {e}")
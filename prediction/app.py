@@ -6,9 +6,15 @@ This is the main FastAPI application that handles all prediction requests.
 import asyncio
 import logging
 import os
-import requests
-from fastapi import FastAPI, HTTPException, Depends
-from sqlalchemy.orm import Session
+import numpy as np
+import orjson
+from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, Query
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, Response
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from datetime import datetime, timezone
 import py_eureka_client.eureka_client as eureka_client
 
 # Get Eureka URL from environment - this is crucial
@@ -17,8 +23,8 @@ print(f"DEBUG: EUREKA_CLIENT_SERVICEURL_DEFAULTZONE = {eureka_url}")
 
 # Import configuration and models
 from config import LOG_LEVEL
-from database import init_db, get_db, PlayerPrediction
-from cache import PredictionCache, test_redis_connection
+from database import init_db, get_db, canonical_name, PlayerPrediction
+from cache import PredictionCache, CACHE_MODE, test_redis_connection, close_redis_connection
 from schemas import (
     PredictionRequest, 
     PredictionResponse,
@@ -33,9 +39,38 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="Basketball Prediction Service",
     description="Simple prediction service - placeholder until XGBoost implementation",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse  # orjson encodes responses much faster than stdlib json
 )
 
+# Only compress large payloads like /predictions - single predictions stay well under 4KB
+app.add_middleware(GZipMiddleware, minimum_size=4096, compresslevel=5)
+
+
+# Only the columns a /predictions row needs - predicted_stats is rebuilt from pts/ast/reb
+STORED_PREDICTION_COLUMNS = (
+    PlayerPrediction.id,
+    PlayerPrediction.player_name,
+    PlayerPrediction.pts,
+    PlayerPrediction.ast,
+    PlayerPrediction.reb,
+    PlayerPrediction.confidence,
+    PlayerPrediction.created_at,
+)
+
+
+def _parse_cursor(cursor: str) -> tuple:
+    """Split a next_cursor value ('<created_at ISO>,<id>') into naive-UTC created_at and id - 422 if malformed"""
+    created_at, _, row_id = cursor.partition(",")
+    try:
+        created_at = datetime.fromisoformat(created_at)
+        row_id = int(row_id) if row_id else None  # A bare timestamp still works, it just can't break ties
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"Invalid cursor: {cursor}")
+    if created_at.tzinfo is not None:
+        created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)  # created_at is stored as naive UTC
+    return created_at, row_id
+
 
 # ============================================
 # Prediction Logic
@@ -59,6 +94,21 @@ def predict_performance(ppg: float, apg: float, rpg: float) -> tuple:
     return 10.0, 10.0, 10.0, 10.0
 
 
+def predict_performance_batch(stats: np.ndarray) -> np.ndarray:
+    """
+    Predict performance for many players in one call.
+    Same placeholder values as predict_performance; once XGBoost lands this
+    becomes a single booster.predict(xgb.DMatrix(stats)) call.
+    
+    Args:
+        stats: float32 array of shape (N, 3) - columns are ppg, apg, rpg
+    
+    Returns:
+        float32 array of shape (N, 4) - predicted points, assists, rebounds, confidence
+    """
+    return np.full((stats.shape[0], 4), 10.0, dtype=np.float32)
+
+
 # ============================================
 # Startup/Shutdown Events
 # ============================================
@@ -68,8 +118,8 @@ async def startup():
     """Called when app starts - initialize database and test cache connection"""
     logger.info("Starting prediction service...")
     logger.info(f"Eureka URL: {eureka_url}")
-    init_db()  # Create database tables if they don't exist
-    test_redis_connection()  # Test if Redis is accessible
+    await init_db()  # Create database tables if they don't exist
+    await test_redis_connection()  # Test if Redis is accessible
     
     # Register with Eureka service discovery
     if eureka_url:
@@ -106,6 +156,7 @@ async def register_with_eureka():
 async def shutdown():
     """Called when app shuts down - cleanup resources"""
     logger.info("Shutting down...")
+    await close_redis_connection()
 
 
 # ============================================
@@ -113,7 +164,7 @@ async def shutdown():
 # ============================================
 
 @app.get("/health")
-def health_check():
+async def health_check():
     """Health check endpoint - used by load balancers and monitoring"""
     return {
         "status": "UP",
@@ -123,7 +174,7 @@ def health_check():
 
 
 @app.get("/")
-def root():
+async def root():
     """Root endpoint - provides service info and available endpoints"""
     return {
         "service": "Basketball Prediction Service",
@@ -145,13 +196,21 @@ def root():
 # ============================================
 
 @app.post("/predict", response_model=PredictionResponse)
-def predict(request: PredictionRequest, db: Session = Depends(get_db)):
-    """Get a prediction for a single player and save to database"""
+async def predict(request: PredictionRequest, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)):
+    """Get a prediction for a single player and save to database - repeat inputs within 5 minutes are served from cache"""
     logger.info(f"Prediction request for: {request.playerName}")
     
     try:
-        # Call prediction function with player stats
-        predicted_pts, predicted_ast, predicted_reb, confidence = predict_performance(
+        # Identical inputs give an identical prediction - reuse the recent result instead of re-running the model
+        cached = await PredictionCache.get_by_input(request)
+        if cached:
+            return cached
+        if CACHE_MODE == "replay":
+            raise HTTPException(status_code=503, detail=f"No cached prediction to replay for {request.playerName}")
+        
+        # Call prediction function with player stats - off the event loop, it will be CPU-bound once XGBoost lands
+        predicted_pts, predicted_ast, predicted_reb, confidence = await asyncio.to_thread(
+            predict_performance,
             request.currentStats.ppg,
             request.currentStats.apg,
             request.currentStats.rpg
@@ -166,17 +225,18 @@ def predict(request: PredictionRequest, db: Session = Depends(get_db)):
         
         new_prediction = PlayerPrediction(
             player_name=request.playerName,
-            predicted_stats=predicted_stats,
+            pts=predicted_pts,
+            ast=predicted_ast,
+            reb=predicted_reb,
             confidence=confidence
         )
         db.add(new_prediction)
-        db.commit()
-        db.refresh(new_prediction)
+        await db.commit()  # id/created_at are populated by the INSERT itself (eager_defaults)
         logger.info(f"✅ Prediction saved to database for {request.playerName}")
         
-        # Cache the prediction
+        # Cache the prediction after the response is sent - keeps Redis off the critical path
         result = new_prediction.to_dict()
-        PredictionCache.set(request.playerName, result)
+        background_tasks.add_task(PredictionCache.set_prediction, request, result)
         
         # Return prediction response in standardized format (same as GET endpoint)
         return PredictionResponse(
@@ -186,38 +246,57 @@ def predict(request: PredictionRequest, db: Session = Depends(get_db)):
             confidence=confidence,
             created_at=new_prediction.created_at
         )
+    except HTTPException:
+        raise  # Re-raise HTTP exceptions
     except Exception as e:
         logger.error(f"Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/predict/batch")
-def predict_batch(request: BatchPredictionRequest):
+async def predict_batch(request: BatchPredictionRequest):
     """Get predictions for multiple players at once"""
     logger.info(f"Batch prediction for {len(request.predictions)} players")
     
-    results = []
-    # Process each player prediction request
-    for pred_req in request.predictions:
-        try:
-            predicted_pts, predicted_ast, predicted_reb, confidence = predict_performance(
-                pred_req.currentStats.ppg,
-                pred_req.currentStats.apg,
-                pred_req.currentStats.rpg
-            )
-            
-            results.append(PredictionResponse(
-                playerName=pred_req.playerName,
-                predictedPoints=predicted_pts,
-                predictedAssists=predicted_ast,
-                predictedRebounds=predicted_reb,
-                confidence=confidence
-            ))
-        except Exception as e:
-            logger.error(f"Error predicting for {pred_req.playerName}: {e}")
-            # Continue processing other predictions even if one fails
+    if not request.predictions:
+        return ORJSONResponse([])
+    
+    # 1. One MGET for every request - identical /predict inputs were already computed
+    # Results are plain JSON-ready dicts in PredictionResponse's shape, handed straight to orjson
+    results = await PredictionCache.get_many_by_input(request.predictions)
+    misses = [i for i, hit in enumerate(results) if not hit]
+    if not misses:
+        return ORJSONResponse(results)
+    if CACHE_MODE == "replay":
+        raise HTTPException(status_code=503, detail=f"No cached prediction to replay for {len(misses)} of the players")
+    
+    # 2. Build one (M, 3) feature matrix of the misses so the model is called once
+    miss_stats = [request.predictions[i].currentStats for i in misses]
+    features = np.array(
+        [[s.ppg, s.apg, s.rpg] for s in miss_stats],
+        dtype=np.float32  # float32 halves memory bandwidth vs float64
+    )
+    try:
+        outputs = (await asyncio.to_thread(predict_performance_batch, features)).tolist()
+    except Exception as e:
+        logger.error(f"Error predicting batch: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    for i, (predicted_pts, predicted_ast, predicted_reb, confidence) in zip(misses, outputs):
+        results[i] = {
+            "id": None,  # Batch predictions are not stored
+            "player_name": request.predictions[i].playerName,
+            "predicted_stats": {
+                "pts": predicted_pts,
+                "ast": predicted_ast,
+                "reb": predicted_reb
+            },
+            "confidence": confidence,
+            "created_at": None
+        }
     
-    return results
+    # Returning the response directly skips FastAPI's jsonable_encoder pass over every row
+    return ORJSONResponse(results)
 
 
 # ============================================
@@ -225,48 +304,80 @@ def predict_batch(request: BatchPredictionRequest):
 # ============================================
 
 @app.get("/predictions")
-def get_all_predictions(limit: int = 50, db: Session = Depends(get_db)):
-    """Get all stored predictions from database (most recent first)"""
-    logger.info(f"Fetching predictions (limit: {limit})")
+async def get_all_predictions(limit: int = 50, cursor: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+    """Get all stored predictions from database (most recent first) - pass next_cursor back as ?cursor= for the next page"""
+    logger.info(f"Fetching predictions (limit: {limit}, cursor: {cursor})")
+    after = _parse_cursor(cursor) if cursor else None
     
     try:
-        # Query database with limit
-        predictions = db.query(PlayerPrediction).order_by(
-            PlayerPrediction.created_at.desc()  # Most recent first
-        ).limit(limit).all()
+        # Query database with limit - plain column rows skip ORM object hydration and the identity map
+        query = select(*STORED_PREDICTION_COLUMNS)
+        if after:
+            # Keyset pagination - an index range scan instead of OFFSET skipping rows. id breaks
+            # created_at ties so rows sharing a timestamp across a page boundary aren't skipped
+            created_at, row_id = after
+            if row_id is None:
+                query = query.where(PlayerPrediction.created_at < created_at)
+            else:
+                query = query.where(tuple_(PlayerPrediction.created_at, PlayerPrediction.id) < tuple_(created_at, row_id))
+        rows = await db.execute(
+            query.order_by(
+                PlayerPrediction.created_at.desc(),  # Most recent first
+                PlayerPrediction.id.desc()
+            ).limit(limit)
+        )
+        predictions = [
+            {
+                "id": row.id,
+                "player_name": row.player_name,
+                "predicted_stats": {"pts": row.pts, "ast": row.ast, "reb": row.reb},
+                "confidence": row.confidence,
+                "created_at": row.created_at
+            }
+            for row in rows
+        ]
         
-        # Return count and list of predictions
-        return {
+        # Return count and list of predictions - rows come straight from the database, so orjson
+        # encodes them directly with no per-row validation
+        return ORJSONResponse({
             "count": len(predictions),
-            "predictions": [p.to_dict() for p in predictions]
-        }
+            "predictions": predictions,
+            "next_cursor": (
+                f"{predictions[-1]['created_at'].isoformat()},{predictions[-1]['id']}"
+                if predictions and len(predictions) == limit else None
+            )
+        })
     except Exception as e:
         logger.error(f"Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/predictions/{player_name}")
-def get_prediction(player_name: str, db: Session = Depends(get_db)):
+async def get_prediction(player_name: str, db: AsyncSession = Depends(get_db)):
     """Get stored prediction for a specific player - checks cache first, then database"""
     logger.info(f"Fetching prediction for: {player_name}")
     
     try:
-        # Try Redis cache first (faster)
-        cached = PredictionCache.get(player_name)
+        # Try the local layer and Redis first - the database is only queried on a miss,
+        # so cache hits never check out a Postgres connection
+        cached = await PredictionCache.get_raw(player_name)  # Stored JSON bytes go out as-is - no decode/re-encode on hits
         if cached:
             logger.info(f"Cache hit for {player_name}")
-            return cached
+            return Response(content=cached, media_type="application/json")
         
         # If not in cache, query database
-        prediction = db.query(PlayerPrediction).filter(
-            PlayerPrediction.player_name == player_name
-        ).order_by(PlayerPrediction.created_at.desc()).first()
+        rows = await db.execute(
+            select(PlayerPrediction).where(
+                PlayerPrediction.canonical_name == canonical_name(player_name)  # Same names as the cache key treats as equal
+            ).order_by(PlayerPrediction.created_at.desc()).limit(1)
+        )
+        prediction = rows.scalars().first()
         
         if prediction:
-            result = prediction.to_dict()
+            payload = orjson.dumps(prediction.to_dict())  # Encoded once, for both the cache and the response
             # Cache the result for future requests
-            PredictionCache.set(player_name, result)
-            return result
+            await PredictionCache.set_raw(player_name, payload)
+            return Response(content=payload, media_type="application/json")
         
         # Not found anywhere
         raise HTTPException(status_code=404, detail=f"No prediction found for {player_name}")
@@ -283,12 +394,15 @@ def get_prediction(player_name: str, db: Session = Depends(get_db)):
 # ============================================
 
 @app.delete("/cache/invalidate")
-def invalidate_cache():
-    """Clear all cached predictions - useful for testing or maintenance"""
-    logger.info("Invalidating cache...")
+async def invalidate_cache(player: Optional[List[str]] = Query(None)):
+    """Clear cached predictions - only the given ?player= names (repeatable), or everything when none are passed"""
+    logger.info(f"Invalidating cache for: {player or 'all players'}")
     
     try:
-        success = PredictionCache.invalidate_all()  # Clear entire cache
+        if player:
+            success = await PredictionCache.invalidate_many(player)  # All players in one pipelined round trip
+        else:
+            success = await PredictionCache.invalidate_all()  # Clear entire cache
         if success:
             return {"message": "Cache cleared"}
         else:
@@ -301,5 +415,12 @@ def invalidate_cache():
 if __name__ == "__main__":
     # Run the app with uvicorn when file is executed directly
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=5002)  # Listen on all interfaces, port 5002
+    uvicorn.run(
+        "app:app",  # Import string so uvicorn can spawn worker processes
+        host="0.0.0.0",  # Listen on all interfaces, port 5002
+        port=5002,
+        workers=int(os.getenv("UVICORN_WORKERS", 1)),  # One process per core to use them all
+        loop="uvloop",  # libuv event loop - faster than the default asyncio loop
+        http="httptools"  # C HTTP parser
+    )
 
@@ -1,50 +1,135 @@
 """
 Redis caching layer for predictions
 Provides fast in-memory caching to avoid repeated predictions.
+Uses redis.asyncio so cache calls never block the event loop, and orjson for (de)serialization.
+A small in-process TTL cache sits in front of Redis for the hottest players.
 """
-import redis
-import json
+import redis.asyncio as redis
+from cachetools import TTLCache
+import hashlib
+import orjson
 import logging
-from typing import Optional, Dict
+import time
+from typing import Optional, Dict, List
 import os
 
+from database import canonical_name  # Cache keys normalize names exactly like the stored canonical_name column
+
 logger = logging.getLogger("prediction-service")
 
 # Redis connection settings
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")  # Redis server hostname
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))  # Redis port number
 REDIS_SSL = os.getenv("REDIS_SSL", "false").lower() == "true"  # Whether to use SSL
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))  # Upper bound on open Redis connections
 CACHE_TTL = 3600  # Cache expiration time in seconds (1 hour)
+DELETE_BATCH_SIZE = 500  # Keys per pipelined DEL batch when clearing the cache
+INPUT_CACHE_TTL = 300  # Expiration for /predict results keyed by exact input (5 minutes)
+
+# Input cache policy for /predict and /predict/batch:
+#   enabled   - read and write cached results (default)
+#   read-only - serve cached results but never write new ones
+#   replay    - serve only cached results; a miss is an error (deterministic reruns without the model)
+#   disabled  - always run the model
+CACHE_MODE = os.getenv("PREDICTION_CACHE_MODE", "enabled").lower()
+CACHE_MODES = ("enabled", "read-only", "replay", "disabled")
+if CACHE_MODE not in CACHE_MODES:
+    raise ValueError(f"PREDICTION_CACHE_MODE must be one of {', '.join(CACHE_MODES)} (got '{CACHE_MODE}')")
+LOCAL_CACHE_SIZE = int(os.getenv("LOCAL_CACHE_SIZE", 1024))  # Max players held in process memory
+LOCAL_CACHE_TTL = int(os.getenv("LOCAL_CACHE_TTL", 60))  # Backstop expiry for local entries
+VERSION_CHECK_INTERVAL = float(os.getenv("LOCAL_CACHE_VERSION_CHECK_SECONDS", 5))  # How often to re-read the cache version - the most a replica lags a change
+
+# In-process layer in front of Redis holding the encoded JSON bytes - only touched from the event loop thread, so no lock is needed
+local_cache = TTLCache(maxsize=LOCAL_CACHE_SIZE, ttl=LOCAL_CACHE_TTL)
+
+# Bumped in Redis on every new prediction, delete and invalidation so other replicas drop their local layer too.
+# Kept outside CACHE_PREFIX so invalidate_all's SCAN never deletes it.
+VERSION_KEY = "prediction-meta:version"
+_local_version = None  # Version the local layer was filled under
+_version_checked_at = 0.0  # time.monotonic() of the last version read
 
-# Initialize Redis client connection
-redis_client = redis.Redis(
+# Shared, bounded connection pool - under a burst, callers wait briefly for a free
+# connection instead of opening a new one per concurrent request
+pool = redis.BlockingConnectionPool(
     host=REDIS_HOST,
     port=REDIS_PORT,
     db=1,  # Using database 1 for predictions (database 0 reserved for other services)
-    ssl=REDIS_SSL,  # SSL support for cloud-hosted Redis
-    decode_responses=True  # Automatically decode responses to strings
+    connection_class=redis.SSLConnection if REDIS_SSL else redis.Connection,  # SSL support for cloud-hosted Redis
+    max_connections=REDIS_MAX_CONNECTIONS,
+    timeout=2,  # Seconds to wait for a free connection before the call fails (and falls back)
+    decode_responses=False  # Keep raw bytes - orjson parses them directly, no separate UTF-8 decode pass
 )
+redis_client = redis.Redis(connection_pool=pool)
 
 class PredictionCache:
     """Redis cache manager - handles storing and retrieving cached predictions"""
 
+    # Key families - all under CACHE_PREFIX, so invalidate_all's SCAN clears every one of them:
+    #   prediction:<canonical name>            latest stored prediction for a player (CACHE_TTL)
+    #   prediction:input:<sha256 of request>   /predict result for an exact request body (INPUT_CACHE_TTL)
+    #   prediction:inputs-of:<canonical name>  set of that player's input keys - the input key itself has no
+    #                                          player in it, so this is how invalidate_many/delete find them
+    # Canonical names have no punctuation, so a player key can never collide with the input/inputs-of families.
     CACHE_PREFIX = "prediction:"  # Prefix for all cache keys to avoid conflicts
+    INPUT_PREFIX = f"{CACHE_PREFIX}input:"  # Keys for results of identical /predict inputs
+    INPUT_INDEX_PREFIX = f"{CACHE_PREFIX}inputs-of:"  # Per-player set of that player's input keys
 
     @staticmethod
     def _get_cache_key(player_name: str) -> str:
         """Generate cache key for player - ensures consistent key format"""
-        return f"{PredictionCache.CACHE_PREFIX}{player_name.lower()}"  # Lowercase for consistency
+        return f"{PredictionCache.CACHE_PREFIX}{canonical_name(player_name)}"
 
     @staticmethod
-    def get(player_name: str) -> Optional[Dict]:
-        """Get prediction from cache - returns None if not found or expired"""
+    def _get_input_key(request) -> str:
+        """Generate cache key from the full request body - same inputs always give the same prediction"""
+        digest = hashlib.sha256(request.model_dump_json().encode()).hexdigest()
+        return f"{PredictionCache.INPUT_PREFIX}{digest}"
+
+    @staticmethod
+    def _get_input_index_key(player_name: str) -> str:
+        """Generate the key of the set tracking a player's input keys"""
+        return f"{PredictionCache.INPUT_INDEX_PREFIX}{canonical_name(player_name)}"
+
+    @staticmethod
+    async def _sync_local_cache() -> None:
+        """Clear the local layer if another replica changed the cache since we last looked (checked at most every few seconds)"""
+        global _local_version, _version_checked_at
+        now = time.monotonic()
+        if now - _version_checked_at < VERSION_CHECK_INTERVAL:
+            return
+        _version_checked_at = now
+        try:
+            version = int(await redis_client.get(VERSION_KEY) or 0)
+        except Exception as e:
+            logger.error(f"Error reading cache version: {e}")
+            return
+        if version != _local_version:
+            local_cache.clear()
+            _local_version = version
+
+    @staticmethod
+    def _adopt_own_version(new_version: int) -> None:
+        """After bumping the version ourselves, keep the local layer if no other replica bumped since our last sync"""
+        global _local_version
+        if _local_version is not None and _local_version + 1 == new_version:
+            _local_version = new_version
+
+    @staticmethod
+    async def get_raw(player_name: str) -> Optional[bytes]:
+        """Get the cached prediction as encoded JSON bytes - returns None if not found or expired"""
+        cache_key = PredictionCache._get_cache_key(player_name)
+        await PredictionCache._sync_local_cache()
+        local = local_cache.get(cache_key)
+        if local is not None:
+            logger.info(f"Local cache HIT for {player_name}")  # Served without a Redis round trip
+            return local
         try:
-            cache_key = PredictionCache._get_cache_key(player_name)
-            cached = redis_client.get(cache_key)  # Redis returns None if key doesn't exist or expired
+            cached = await redis_client.get(cache_key)  # Redis returns None if key doesn't exist or expired
 
             if cached:
                 logger.info(f"Cache HIT for {player_name}")  # Found cached prediction
-                return json.loads(cached)  # Convert JSON string back to dict
+                local_cache[cache_key] = cached
+                return cached
             else:
                 logger.info(f"Cache MISS for {player_name}")  # Not found in cache
                 return None
@@ -53,15 +138,19 @@ class PredictionCache:
             return None  # Return None on error so app continues
 
     @staticmethod
-    def set(player_name: str, prediction_data: Dict, ttl: int = CACHE_TTL) -> bool:
-        """Set prediction in cache with time-to-live (TTL)"""
+    async def get(player_name: str) -> Optional[Dict]:
+        """Get prediction from cache - returns None if not found or expired"""
+        cached = await PredictionCache.get_raw(player_name)
+        return orjson.loads(cached) if cached else None  # Convert JSON bytes back to dict
+
+    @staticmethod
+    async def set_raw(player_name: str, payload: bytes, ttl: int = CACHE_TTL) -> bool:
+        """Set already-encoded prediction JSON in cache with time-to-live (TTL) - writes through to the local layer too"""
+        # Only used to fill from the database, which no replica's copy is newer than - so unlike set_prediction, no version bump
+        cache_key = PredictionCache._get_cache_key(player_name)
+        local_cache[cache_key] = payload
         try:
-            cache_key = PredictionCache._get_cache_key(player_name)
-            redis_client.setex(
-                cache_key,
-                ttl,  # Expiration time in seconds
-                json.dumps(prediction_data)  # Convert dict to JSON string for storage
-            )
+            await redis_client.setex(cache_key, ttl, payload)  # Expiration time in seconds
             logger.info(f"Cached prediction for {player_name} (TTL: {ttl}s)")
             return True
         except Exception as e:
@@ -69,11 +158,101 @@ class PredictionCache:
             return False  # Return False on error so app continues
 
     @staticmethod
-    def delete(player_name: str) -> bool:
-        """Delete specific prediction from cache"""
+    async def set(player_name: str, prediction_data: Dict, ttl: int = CACHE_TTL) -> bool:
+        """Set prediction in cache with time-to-live (TTL) - writes through to the local layer too"""
+        return await PredictionCache.set_raw(player_name, orjson.dumps(prediction_data), ttl)  # Serialize dict to JSON bytes for storage
+
+    @staticmethod
+    async def get_by_input(request) -> Optional[Dict]:
+        """Get a /predict result for an identical PredictionRequest - returns None if not found, expired or disabled"""
+        if CACHE_MODE == "disabled":
+            return None
+        try:
+            cached = await redis_client.get(PredictionCache._get_input_key(request))
+            if cached:
+                logger.info(f"Input cache HIT for {request.playerName}")
+                return orjson.loads(cached)
+            return None
+        except Exception as e:
+            logger.error(f"Error reading from cache: {e}")
+            return None  # Return None on error so app continues
+
+    @staticmethod
+    async def set_prediction(request, prediction_data: Dict) -> bool:
+        """Cache a new /predict result under its player and its exact inputs in one pipelined round trip"""
+        player_key = PredictionCache._get_cache_key(request.playerName)
+        payload = orjson.dumps(prediction_data)
+        local_cache[player_key] = payload
+        try:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                pipe.setex(player_key, CACHE_TTL, payload)
+                if CACHE_MODE == "enabled":
+                    input_key = PredictionCache._get_input_key(request)
+                    index_key = PredictionCache._get_input_index_key(request.playerName)
+                    pipe.setex(input_key, INPUT_CACHE_TTL, payload)
+                    pipe.sadd(index_key, input_key)  # Lets invalidate_many find this input key by player
+                    pipe.expire(index_key, INPUT_CACHE_TTL)  # The set lives as long as its newest input key
+                pipe.incr(VERSION_KEY)  # Replicas holding this player's older prediction locally drop it
+                results = await pipe.execute()
+            PredictionCache._adopt_own_version(results[-1])
+            logger.info(f"Cached prediction for {request.playerName} (TTL: {CACHE_TTL}s)")
+            return True
+        except Exception as e:
+            logger.error(f"Error writing to cache: {e}")
+            return False  # Return False on error so app continues
+
+    @staticmethod
+    async def get_many_by_input(requests: List) -> List[Optional[Dict]]:
+        """Look up many /predict results in one MGET round trip - None for each miss, in input order"""
+        if not requests or CACHE_MODE == "disabled":
+            return [None] * len(requests)
+        try:
+            cached = await redis_client.mget([PredictionCache._get_input_key(r) for r in requests])
+            return [orjson.loads(c) if c else None for c in cached]
+        except Exception as e:
+            logger.error(f"Error reading from cache: {e}")
+            return [None] * len(requests)  # Treat everything as a miss so app continues
+
+    @staticmethod
+    async def _delete_keys(keys: List[str]) -> None:
+        """Delete keys with one pipelined round trip per DELETE_BATCH_SIZE keys, and bump the cache version"""
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for start in range(0, len(keys), DELETE_BATCH_SIZE):
+                pipe.unlink(*keys[start:start + DELETE_BATCH_SIZE])  # UNLINK frees memory in a background thread
+            pipe.incr(VERSION_KEY)  # Tells every replica's local layer to clear
+            results = await pipe.execute()
+        PredictionCache._adopt_own_version(results[-1])
+
+    @staticmethod
+    async def _player_keys(player_names: List[str]) -> List:
+        """Every key cached for these players - their prediction keys, input-key sets and the input keys in them"""
+        index_keys = [PredictionCache._get_input_index_key(n) for n in player_names]
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for index_key in index_keys:
+                pipe.smembers(index_key)
+            input_keys = [key for members in await pipe.execute() for key in members]  # One round trip for all sets
+        return [PredictionCache._get_cache_key(n) for n in player_names] + index_keys + input_keys
+
+    @staticmethod
+    async def invalidate_many(player_names: List[str]) -> bool:
+        """Delete cached predictions, including identical-input results, for several players in two round trips"""
         try:
-            cache_key = PredictionCache._get_cache_key(player_name)
-            redis_client.delete(cache_key)  # Redis delete silently succeeds if key doesn't exist
+            if player_names:
+                for name in player_names:
+                    local_cache.pop(PredictionCache._get_cache_key(name), None)
+                await PredictionCache._delete_keys(await PredictionCache._player_keys(player_names))
+                logger.info(f"Deleted cache for {len(player_names)} players")
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting from cache: {e}")
+            return False
+
+    @staticmethod
+    async def delete(player_name: str) -> bool:
+        """Delete specific prediction from cache, including its identical-input results"""
+        local_cache.pop(PredictionCache._get_cache_key(player_name), None)
+        try:
+            await PredictionCache._delete_keys(await PredictionCache._player_keys([player_name]))  # Redis delete silently succeeds if key doesn't exist
             logger.info(f"Deleted cache for {player_name}")
             return True
         except Exception as e:
@@ -81,26 +260,41 @@ class PredictionCache:
             return False
 
     @staticmethod
-    def invalidate_all() -> bool:
+    async def invalidate_all() -> bool:
         """Clear all prediction caches"""
+        local_cache.clear()
         try:
             pattern = f"{PredictionCache.CACHE_PREFIX}*"
-            keys = redis_client.keys(pattern)
-            if keys:
-                redis_client.delete(*keys)
-                logger.info(f"🗑️ Invalidated {len(keys)} cached predictions")
+            # SCAN walks the keyspace incrementally instead of blocking Redis like KEYS,
+            # and each full batch is unlinked as we go so keys are never all held in memory
+            deleted = 0
+            batch = []
+            async for key in redis_client.scan_iter(match=pattern, count=DELETE_BATCH_SIZE):
+                batch.append(key)
+                if len(batch) >= DELETE_BATCH_SIZE:
+                    await redis_client.unlink(*batch)
+                    deleted += len(batch)
+                    batch = []
+            await PredictionCache._delete_keys(batch)  # Remainder - bumps the version even with no keys, so replicas still clear
+            deleted += len(batch)
+            logger.info(f"🗑️ Invalidated {deleted} cached predictions")
             return True
         except Exception as e:
             logger.error(f"Error invalidating cache: {e}")
             return False
 
 
-def test_redis_connection() -> bool:
+async def test_redis_connection() -> bool:
     """Test Redis connection"""
     try:
-        redis_client.ping()
+        await redis_client.ping()
         logger.info(f"✅ Redis connection successful (SSL: {REDIS_SSL})")
         return True
     except Exception as e:
         logger.error(f"❌ Redis connection failed: {e}")
-        return False
\ No newline at end of file
+        return False
+
+
+async def close_redis_connection():
+    """Close the Redis connection pool - called on app shutdown"""
+    await redis_client.aclose(close_connection_pool=True)  # A client built from an explicit pool leaves it open otherwise
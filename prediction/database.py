@@ -2,19 +2,62 @@
 Database configuration and models
 Manages PostgreSQL connection and defines all table schemas.
 """
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, JSON
+from sqlalchemy import Column, Integer, String, Float, DateTime, JSON, Index, bindparam, inspect, column, table, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import validates
 from datetime import datetime
 import logging
+import re
+import unicodedata
 
-from config import DATABASE_URL
+from config import DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE
 
 logger = logging.getLogger(__name__)
 
-# Create database engine with connection pooling
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)  # pool_pre_ping tests connections before using them
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)  # Session factory for creating DB sessions
+# Precompiled once - used on every cache key and every saved prediction
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def canonical_name(player_name: str) -> str:
+    """Safe normalizations only - 'Nikola Jokić ', 'nikola  jokic' and 'Nikola Jokic' are the same player"""
+    # Drop combining marks only - non-Latin letters stay, so Cyrillic/CJK/Greek names stay distinct
+    decomposed = unicodedata.normalize("NFKD", player_name)
+    name = "".join(c for c in decomposed if unicodedata.category(c) != "Mn")
+    name = _PUNCTUATION.sub("", name.casefold())
+    return _WHITESPACE.sub(" ", name).strip()
+
+
+def _async_url(url: str) -> str:
+    """Point plain postgres URLs at the asyncpg driver so existing DATABASE_URL values keep working"""
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            url = "postgresql+asyncpg://" + url[len(prefix):]
+            break
+    else:
+        return url
+    parsed = make_url(url)
+    sslmode = parsed.query.get("sslmode")
+    if sslmode is None:
+        return url
+    # asyncpg rejects libpq's ?sslmode= but takes the same modes (require, verify-full, ...) as ?ssl=
+    parsed = parsed.difference_update_query(["sslmode"]).update_query_dict({"ssl": sslmode})
+    return parsed.render_as_string(hide_password=False)
+
+
+# Create async database engine with connection pooling sized to request concurrency
+engine = create_async_engine(
+    _async_url(DATABASE_URL),
+    pool_pre_ping=True,  # pool_pre_ping tests connections before using them
+    pool_use_lifo=True,  # Reuse the most recent connection so a warm subset keeps its plan cache and idle overflow closes sooner
+    pool_size=DB_POOL_SIZE,  # Connections kept open in the pool
+    max_overflow=DB_MAX_OVERFLOW,  # Extra connections allowed under burst load
+    pool_recycle=DB_POOL_RECYCLE  # Drop connections before server/proxy idle timeouts kill them
+)
+# Session factory - expire_on_commit=False keeps attributes readable after commit without another query
+SessionLocal = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
@@ -25,13 +68,33 @@ class PlayerPrediction(Base):
     Main table - stores all prediction results with timestamps
     """
     __tablename__ = "player_predictions"
+    __mapper_args__ = {"eager_defaults": True}  # Load generated id/created_at at flush via RETURNING - no refresh needed
 
     id = Column(Integer, primary_key=True, index=True)  # Unique ID for each prediction
-    player_name = Column(String(255), nullable=False, index=True)  # Player name (indexed for fast lookup)
-    predicted_stats = Column(JSON, nullable=True)  # JSON object with predicted points, assists, rebounds
+    player_name = Column(String(255), nullable=False)  # Player name as the client sent it
+    canonical_name = Column(String(255), nullable=True)  # canonical_name(player_name) - what lookups and cache keys match on
+    pts = Column(Float, nullable=True)  # Predicted points
+    ast = Column(Float, nullable=True)  # Predicted assists
+    reb = Column(Float, nullable=True)  # Predicted rebounds
     confidence = Column(Float, nullable=True)  # Model's confidence score (0.0 - 1.0)
     created_at = Column(DateTime, default=datetime.utcnow)  # When this prediction was created
 
+    __table_args__ = (
+        Index("ix_pred_canonical_created", canonical_name, created_at.desc()),  # Latest prediction for a player without a sort
+        Index("ix_pred_created_id", created_at.desc(), id.desc()),  # Most recent predictions for /predictions, keyset on (created_at, id)
+    )
+
+    @validates("player_name")
+    def _set_canonical_name(self, key, value):
+        """Keep canonical_name in step with player_name on every new row"""
+        self.canonical_name = canonical_name(value)
+        return value
+
+    @property
+    def predicted_stats(self):
+        """Predicted points, assists, rebounds in the API's predicted_stats shape"""
+        return {"pts": self.pts, "ast": self.ast, "reb": self.reb}
+
     def to_dict(self):
         """Convert database record to dictionary for JSON response"""
         return {
@@ -43,20 +106,81 @@ class PlayerPrediction(Base):
         }
 
 
-def init_db():
+STAT_COLUMNS = ("pts", "ast", "reb")
+SCHEMA_LOCK_KEY = 5002  # Advisory lock id held while init_db creates/migrates the schema
+# The old JSON column, only read to backfill pts/ast/reb on tables created before they existed
+_legacy_predictions = table(
+    "player_predictions", column("predicted_stats", JSON), *(column(name) for name in STAT_COLUMNS)
+)
+
+
+def _add_missing_columns(sync_conn, existing, columns):
+    """Add columns (name -> SQL type) an existing table doesn't have yet - returns the names it added"""
+    missing = [name for name in columns if name not in existing]
+    if_not_exists = "IF NOT EXISTS " if sync_conn.dialect.name == "postgresql" else ""
+    for name in missing:
+        sync_conn.execute(text(
+            f"ALTER TABLE {PlayerPrediction.__tablename__} ADD COLUMN {if_not_exists}{name} {columns[name]}"
+        ))
+    return missing
+
+
+def _migrate_stat_columns(sync_conn):
+    """Add the typed stat columns to an existing table and fill them once from the old predicted_stats JSON"""
+    existing = {c["name"] for c in inspect(sync_conn).get_columns(PlayerPrediction.__tablename__)}
+    missing = _add_missing_columns(sync_conn, existing, {name: "FLOAT" for name in STAT_COLUMNS})
+    # Backfill only when the columns were just added - later restarts skip the table scan
+    if missing and "predicted_stats" in existing:
+        stats = _legacy_predictions.c.predicted_stats
+        sync_conn.execute(
+            _legacy_predictions.update()
+            .where(_legacy_predictions.c.pts.is_(None), stats.is_not(None))
+            .values({name: stats[name].as_float() for name in STAT_COLUMNS})
+        )
+
+
+def _migrate_canonical_name(sync_conn):
+    """Add canonical_name to an existing table and fill it once - in Python, since SQL can't strip accents the same way"""
+    existing = {c["name"] for c in inspect(sync_conn).get_columns(PlayerPrediction.__tablename__)}
+    if not _add_missing_columns(sync_conn, existing, {"canonical_name": "VARCHAR(255)"}):
+        return
+    predictions = PlayerPrediction.__table__
+    rows = sync_conn.execute(predictions.select().with_only_columns(predictions.c.id, predictions.c.player_name)).all()
+    if rows:
+        sync_conn.execute(
+            predictions.update().where(predictions.c.id == bindparam("row_id")).values(canonical_name=bindparam("name")),
+            [{"row_id": row.id, "name": canonical_name(row.player_name)} for row in rows]
+        )
+
+
+def _create_missing_indexes(sync_conn):
+    """Add indexes introduced after the table was first created, and drop the one they make redundant"""
+    sync_conn.execute(text("DROP INDEX IF EXISTS ix_player_predictions_player_name"))  # Lookups go through ix_pred_canonical_created
+    for index in PlayerPrediction.__table__.indexes:
+        index.create(sync_conn, checkfirst=True)
+
+
+async def init_db():
     """Initialize database tables - called once at app startup"""
     try:
-        Base.metadata.create_all(bind=engine)  # Creates all tables defined in models
+        async with engine.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                # Every uvicorn worker runs this at startup - serialize them so only one creates/migrates,
+                # the rest wait and then find everything in place. Released when the transaction ends.
+                await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": SCHEMA_LOCK_KEY})
+            await conn.run_sync(Base.metadata.create_all)  # Creates all tables defined in models
+            await conn.run_sync(_migrate_stat_columns)  # create_all doesn't add columns to tables that already exist
+            await conn.run_sync(_migrate_canonical_name)
+            await conn.run_sync(_create_missing_indexes)  # create_all skips indexes on tables that already exist
         logger.info("✅ Database tables created successfully")
     except Exception as e:
         logger.error(f"❌ Error creating database tables: {e}")
         raise
 
 
-def get_db():
-    """Get database session - used as dependency in FastAPI endpoints"""
-    db = SessionLocal()  # Create new session
-    try:
-        yield db  # Provide session to the endpoint
-    finally:
-        db.close()  # Clean up - close connection after endpoint finishes
+async def get_db():
+    """Get async database session - used as dependency in FastAPI endpoints"""
+    # The session only checks a connection out of the pool on its first query and
+    # returns it when the block exits, so cache hits never hold a connection
+    async with SessionLocal() as db:
+        yield db
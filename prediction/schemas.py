@@ -3,13 +3,15 @@ Pydantic request/response models
 Defines all data structures for API requests and responses.
 These models ensure data validation and provide API documentation.
 """
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import List, Optional
 from datetime import datetime
 
 
 class PlayerStats(BaseModel):
     """Input player stats - the features we use for predictions"""
+    model_config = ConfigDict(extra="ignore", frozen=True)  # Request data is never mutated
+
     ppg: float  # Points per game
     apg: float  # Assists per game
     rpg: float  # Rebounds per game
@@ -24,6 +26,8 @@ class PlayerStats(BaseModel):
 
 class PredictionRequest(BaseModel):
     """Request for prediction - what client sends to /predict endpoint"""
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
     playerName: str  # Name of player to predict
     currentStats: PlayerStats  # Player's current season stats
     homeGame: bool = True  # Whether the game is at home (defaults to true)
@@ -40,13 +44,6 @@ class PredictionResponse(BaseModel):
 
 class BatchPredictionRequest(BaseModel):
     """Batch prediction request - predict multiple players at once"""
-    predictions: List[PredictionRequest]  # List of prediction requests
-
+    model_config = ConfigDict(extra="ignore", frozen=True)
 
-class StoredPredictionResponse(BaseModel):
-    """Stored prediction from database - what's returned from /predictions endpoints"""
-    id: int  # Database record ID
-    player_name: str  # Player name
-    predicted_stats: dict  # JSON object with predicted values
-    confidence: float  # Model confidence score
-    created_at: datetime  # When prediction was created
+    predictions: List[PredictionRequest]  # List of prediction requests